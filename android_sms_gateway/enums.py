@@ -7,3 +7,8 @@ class ProcessState(enum.Enum):
     Sent = "Sent"
     Delivered = "Delivered"
     Failed = "Failed"
+
+
+class MessageEncoding(enum.Enum):
+    GSM7 = "GSM7"
+    UCS2 = "UCS2"
@@ -0,0 +1,332 @@
+import asyncio
+import collections
+import json
+import time
+import typing as t
+
+from .ahttp import AsyncHttpClient
+from .http import HttpClient
+
+_Entry = t.Dict[t.Any, t.Any]
+# marks replayed entries, can't clash with JSON keys
+_USED = object()
+_Entries = t.Dict[t.Tuple[t.Any, ...], t.Deque[_Entry]]
+
+
+class RecordedError(Exception):
+    """Raised on replay of a request that failed during recording."""
+
+    def __init__(
+        self, type: str, message: str, *, status: t.Optional[int] = None
+    ) -> None:
+        super().__init__(f"{type}: {message}")
+        self.type = type
+        self.message = message
+        self.status = status
+
+
+def _status_of(error: Exception) -> t.Optional[int]:
+    # requests and httpx keep the response, aiohttp keeps the status itself
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(error, "status", None)
+
+    return status if isinstance(status, int) else None
+
+
+def _dump_entry(
+    method: str,
+    url: str,
+    payload: t.Optional[dict],
+    response: t.Optional[dict],
+    error: t.Optional[Exception],
+    elapsed: float,
+) -> str:
+    entry: t.Dict[str, t.Any] = {"method": method, "url": url}
+    if payload is not None:
+        entry["payload"] = payload
+    if error is not None:
+        entry["error"] = {"type": type(error).__name__, "message": str(error)}
+        status = _status_of(error)
+        if status is not None:
+            entry["error"]["status"] = status
+    else:
+        entry["response"] = response
+    entry["elapsed"] = round(elapsed, 6)
+
+    return json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n"
+
+
+def _payload_key(payload: t.Optional[dict]) -> t.Optional[str]:
+    if payload is None:
+        return None
+
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"))
+
+
+def _load_entries(path: str) -> t.Tuple[_Entries, _Entries]:
+    """Returns entries queued by method and URL, and by payload as well."""
+    by_url: _Entries = collections.defaultdict(collections.deque)
+    by_payload: _Entries = collections.defaultdict(collections.deque)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            key = (entry["method"], entry["url"])
+            by_url[key].append(entry)
+            by_payload[key + (_payload_key(entry.get("payload")),)].append(entry)
+
+    return by_url, by_payload
+
+
+class _BaseRecorder:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file: t.Optional[t.TextIO] = None
+
+    def _open(self) -> None:
+        if self._file is not None:
+            raise ValueError("Recording already started")
+
+        # line buffered, so a crash loses at most the request in flight
+        self._file = open(self.path, "w", encoding="utf-8", buffering=1)
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(
+        self,
+        method: str,
+        url: str,
+        payload: t.Optional[dict],
+        started: float,
+        *,
+        response: t.Optional[dict] = None,
+        error: t.Optional[Exception] = None,
+    ) -> None:
+        if self._file is None:
+            raise ValueError("Recording is not started")
+
+        self._file.write(
+            _dump_entry(
+                method, url, payload, response, error, time.perf_counter() - started
+            )
+        )
+
+
+class _BaseReplayer:
+    def __init__(self, path: str, *, latency: float = 1.0) -> None:
+        if latency < 0:
+            raise ValueError("Latency scale must be non-negative")
+
+        self.path = path
+        self.latency = latency
+        self._by_url, self._by_payload = _load_entries(path)
+
+    def _next(
+        self, method: str, url: str, payload: t.Optional[dict]
+    ) -> t.Tuple[_Entry, float]:
+        key = (method, url)
+        entry = self._pop(self._by_payload.get(key + (_payload_key(payload),)))
+        if entry is None:
+            entry = self._pop(self._by_url.get(key))
+        if entry is None:
+            raise LookupError(f"No recorded response for {method} {url}")
+
+        # the entry stays in the other queue and is skipped there later
+        entry[_USED] = True
+
+        return entry, entry.get("elapsed", 0.0) * self.latency
+
+    def _pop(self, queue: t.Optional[t.Deque[_Entry]]) -> t.Optional[_Entry]:
+        while queue:
+            entry = queue.popleft()
+            if _USED not in entry:
+                return entry
+
+        return None
+
+    def _result(self, entry: t.Dict[str, t.Any]) -> dict:
+        error = entry.get("error")
+        if error is not None:
+            raise RecordedError(
+                error["type"], error["message"], status=error.get("status")
+            )
+
+        return entry["response"]
+
+
+class RecordingHttpClient(_BaseRecorder, HttpClient):
+    """Wraps an `HttpClient` and writes every response to an NDJSON file.
+
+    Failed requests are recorded too and replayed as `RecordedError`.
+    Request headers are never recorded, so credentials do not leak into
+    the recording.
+    """
+
+    def __init__(self, client: HttpClient, path: str) -> None:
+        super().__init__(path)
+        self._client = client
+
+    def __enter__(self):
+        self._open()
+        try:
+            self._client.__enter__()
+        except BaseException:
+            self._close()
+            raise
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self._client.__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            self._close()
+
+    def get(self, url: str, *, headers: t.Optional[t.Dict[str, str]] = None) -> dict:
+        started = time.perf_counter()
+        try:
+            response = self._client.get(url, headers=headers)
+        except Exception as e:
+            self._write("GET", url, None, started, error=e)
+            raise
+        self._write("GET", url, None, started, response=response)
+
+        return response
+
+    def post(
+        self,
+        url: str,
+        payload: dict,
+        *,
+        headers: t.Optional[t.Dict[str, str]] = None,
+    ) -> dict:
+        started = time.perf_counter()
+        try:
+            response = self._client.post(url, payload, headers=headers)
+        except Exception as e:
+            self._write("POST", url, payload, started, error=e)
+            raise
+        self._write("POST", url, payload, started, response=response)
+
+        return response
+
+
+class ReplayHttpClient(_BaseReplayer, HttpClient):
+    """Serves responses from a file written by `RecordingHttpClient`.
+
+    Responses are matched by method, URL and payload in recording order.
+    Requests with a payload that was never recorded, e.g. encrypted messages
+    with random salts, fall back to the next unused response for the method
+    and URL, which may belong to another request. `latency` scales the
+    recorded timings: `1.0` reproduces them, `0` disables waiting.
+    """
+
+    def __enter__(self):
+        return self
+
+    def get(self, url: str, *, headers: t.Optional[t.Dict[str, str]] = None) -> dict:
+        return self._replay("GET", url, None)
+
+    def post(
+        self,
+        url: str,
+        payload: dict,
+        *,
+        headers: t.Optional[t.Dict[str, str]] = None,
+    ) -> dict:
+        return self._replay("POST", url, payload)
+
+    def _replay(self, method: str, url: str, payload: t.Optional[dict]) -> dict:
+        entry, delay = self._next(method, url, payload)
+        if delay > 0:
+            time.sleep(delay)
+
+        return self._result(entry)
+
+
+class AsyncRecordingHttpClient(_BaseRecorder, AsyncHttpClient):
+    """Async counterpart of `RecordingHttpClient`."""
+
+    def __init__(self, client: AsyncHttpClient, path: str) -> None:
+        super().__init__(path)
+        self._client = client
+
+    async def __aenter__(self):
+        self._open()
+        try:
+            await self._client.__aenter__()
+        except BaseException:
+            self._close()
+            raise
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            await self._client.__aexit__(exc_type, exc_val, exc_tb)
+        finally:
+            self._close()
+
+    async def get(
+        self, url: str, *, headers: t.Optional[t.Dict[str, str]] = None
+    ) -> dict:
+        started = time.perf_counter()
+        try:
+            response = await self._client.get(url, headers=headers)
+        except Exception as e:
+            self._write("GET", url, None, started, error=e)
+            raise
+        self._write("GET", url, None, started, response=response)
+
+        return response
+
+    async def post(
+        self,
+        url: str,
+        payload: dict,
+        *,
+        headers: t.Optional[t.Dict[str, str]] = None,
+    ) -> dict:
+        started = time.perf_counter()
+        try:
+            response = await self._client.post(url, payload, headers=headers)
+        except Exception as e:
+            self._write("POST", url, payload, started, error=e)
+            raise
+        self._write("POST", url, payload, started, response=response)
+
+        return response
+
+
+class AsyncReplayHttpClient(_BaseReplayer, AsyncHttpClient):
+    """Async counterpart of `ReplayHttpClient`."""
+
+    async def __aenter__(self):
+        return self
+
+    async def get(
+        self, url: str, *, headers: t.Optional[t.Dict[str, str]] = None
+    ) -> dict:
+        return await self._replay("GET", url, None)
+
+    async def post(
+        self,
+        url: str,
+        payload: dict,
+        *,
+        headers: t.Optional[t.Dict[str, str]] = None,
+    ) -> dict:
+        return await self._replay("POST", url, payload)
+
+    async def _replay(
+        self, method: str, url: str, payload: t.Optional[dict]
+    ) -> dict:
+        entry, delay = self._next(method, url, payload)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        return self._result(entry)
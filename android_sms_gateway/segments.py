@@ -0,0 +1,154 @@
+import dataclasses
+import datetime
+import heapq
+import math
+import typing as t
+
+from . import domain
+from .enums import MessageEncoding
+
+# GSM 03.38 default alphabet (the escape character itself is excluded)
+GSM7_BASIC = (
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+# GSM 03.38 extension table, every character takes two septets
+GSM7_EXTENSION = "\f^{}\\[~]|€"
+
+GSM7_SINGLE_LIMIT = 160
+GSM7_MULTI_LIMIT = 153
+UCS2_SINGLE_LIMIT = 70
+UCS2_MULTI_LIMIT = 67
+
+_GSM7_DELETE = str.maketrans("", "", GSM7_BASIC + GSM7_EXTENSION)
+
+
+@dataclasses.dataclass(frozen=True)
+class Segments:
+    encoding: MessageEncoding
+    units: int
+    parts: int
+
+
+@dataclasses.dataclass(frozen=True)
+class CampaignPlan:
+    messages: int
+    recipients: int
+    parts: int
+    duration: datetime.timedelta
+
+
+def _split_gsm7(text: str, units: int) -> int:
+    if units <= GSM7_SINGLE_LIMIT:
+        return 1
+
+    if units == len(text):
+        return math.ceil(units / GSM7_MULTI_LIMIT)
+
+    # escape sequences can't be split between parts
+    parts, used = 1, 0
+    for c in text:
+        size = 2 if c in GSM7_EXTENSION else 1
+        if used + size > GSM7_MULTI_LIMIT:
+            parts += 1
+            used = 0
+        used += size
+
+    return parts
+
+
+def _split_ucs2(text: str, units: int) -> int:
+    if units <= UCS2_SINGLE_LIMIT:
+        return 1
+
+    if units == len(text):
+        return math.ceil(units / UCS2_MULTI_LIMIT)
+
+    # surrogate pairs can't be split between parts
+    parts, used = 1, 0
+    for c in text:
+        size = 2 if ord(c) > 0xFFFF else 1
+        if used + size > UCS2_MULTI_LIMIT:
+            parts += 1
+            used = 0
+        used += size
+
+    return parts
+
+
+def count_segments(text: str) -> Segments:
+    """Returns encoding, length in encoding units and number of SMS parts.
+
+    Units are septets for GSM-7 and UTF-16 code units for UCS-2.
+    """
+    if not text.translate(_GSM7_DELETE):
+        units = len(text) + sum(text.count(c) for c in GSM7_EXTENSION)
+        return Segments(
+            encoding=MessageEncoding.GSM7,
+            units=units,
+            parts=_split_gsm7(text, units),
+        )
+
+    units = len(text.encode("utf-16-le")) // 2
+    return Segments(
+        encoding=MessageEncoding.UCS2,
+        units=units,
+        parts=_split_ucs2(text, units),
+    )
+
+
+def count_segments_batch(texts: t.Iterable[str]) -> t.List[Segments]:
+    """Like `count_segments`, but computes each distinct text only once."""
+    cache: t.Dict[str, Segments] = {}
+    result = []
+    for text in texts:
+        segments = cache.get(text)
+        if segments is None:
+            segments = cache[text] = count_segments(text)
+        result.append(segments)
+
+    return result
+
+
+def plan_campaign(
+    messages: t.Iterable[domain.Message],
+    *,
+    parts_per_minute: float,
+    devices: int = 1,
+) -> CampaignPlan:
+    """Estimates the number of SMS parts and the time needed to send them.
+
+    Every recipient of a message receives all of its parts, and a message is
+    sent by a single device. Messages are assigned largest first to the least
+    loaded device, and the duration is the time of the busiest one.
+    `parts_per_minute` is the sending rate of a single device.
+    """
+    if parts_per_minute <= 0:
+        raise ValueError("Parts per minute must be positive")
+    if devices < 1:
+        raise ValueError("At least one device is required")
+
+    messages = list(messages)
+    if any(message.is_encrypted for message in messages):
+        raise ValueError("Can't plan encrypted messages")
+
+    segments = count_segments_batch(message.message for message in messages)
+    recipients = sum(len(message.phone_numbers) for message in messages)
+    loads = sorted(
+        (
+            s.parts * len(message.phone_numbers)
+            for s, message in zip(segments, messages)
+        ),
+        reverse=True,
+    )
+
+    busiest = [0] * min(devices, len(loads) or 1)
+    for load in loads:
+        heapq.heapreplace(busiest, busiest[0] + load)
+
+    return CampaignPlan(
+        messages=len(messages),
+        recipients=recipients,
+        parts=sum(loads),
+        duration=datetime.timedelta(minutes=max(busiest) / parts_per_minute),
+    )
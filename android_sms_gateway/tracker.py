@@ -0,0 +1,413 @@
+import array
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import typing as t
+
+from .domain import MessageState, RecipientState
+from .enums import ProcessState
+
+_STATES = list(ProcessState)
+_CODES = {state: code for code, state in enumerate(_STATES)}
+
+_HASHED = 1
+_ENCRYPTED = 2
+
+_NO_ERROR = -1
+
+# stale index entries and unused recipient rows are dropped once there are
+# more of them than live ones, but not before this many
+_MIN_GARBAGE = 1024
+
+# order of the arrays in a snapshot
+_COLUMNS = (
+    "_states",
+    "_since",
+    "_flags",
+    "_rec_start",
+    "_rec_count",
+    "_rec_phone",
+    "_rec_state",
+    "_rec_error",
+)
+
+
+class _Interner:
+    def __init__(self, values: t.Optional[t.List[str]] = None) -> None:
+        self.values: t.List[str] = values or []
+        self.index = {value: i for i, value in enumerate(self.values)}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def add(self, value: str) -> int:
+        i = self.index.get(value)
+        if i is None:
+            i = self.index[value] = len(self.values)
+            self.values.append(value)
+
+        return i
+
+
+class MessageTracker:
+    """Keeps the latest `MessageState` per message ID in a compact form.
+
+    States are stored in array-backed columns, and `MessageState` objects are
+    built only on read. `since` is the time a message entered its current state.
+
+    For each state an index keeps rows in the order they entered it, so
+    `older_than` stops at the first row that is too recent. If `now` went
+    backwards, the index is sorted again on the next query.
+    """
+
+    def __init__(self) -> None:
+        self._ids = _Interner()
+        self._phones = _Interner()
+        self._errors = _Interner()
+        self._counts = [0] * len(_STATES)
+
+        self._states = bytearray()
+        self._since = array.array("d")
+        self._flags = bytearray()
+        self._rec_start = array.array("I")
+        self._rec_count = array.array("I")
+
+        self._rec_phone = array.array("I")
+        self._rec_state = bytearray()
+        self._rec_error = array.array("i")
+        self._dead_rows = 0
+
+        # position of each row in the index of its current state
+        self._slots = array.array("I")
+        self._index = [array.array("I") for _ in _STATES]
+        self._sorted = [True] * len(_STATES)
+        self._last = [float("-inf")] * len(_STATES)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, _id: object) -> bool:
+        return _id in self._ids.index
+
+    def __iter__(self) -> t.Iterator[str]:
+        return iter(self._ids.values)
+
+    def __getitem__(self, _id: str) -> MessageState:
+        return self._build(self._ids.index[_id])
+
+    def get(
+        self, _id: str, default: t.Optional[MessageState] = None
+    ) -> t.Optional[MessageState]:
+        i = self._ids.index.get(_id)
+        if i is None:
+            return default
+
+        return self._build(i)
+
+    def update(self, state: MessageState, *, now: t.Optional[float] = None) -> None:
+        if now is None:
+            now = time.time()
+
+        code = _CODES[state.state]
+        flags = (_HASHED if state.is_hashed else 0) | (
+            _ENCRYPTED if state.is_encrypted else 0
+        )
+
+        i = self._ids.index.get(state.id)
+        if i is None:
+            self._ids.add(state.id)
+            self._states.append(code)
+            self._since.append(now)
+            self._flags.append(flags)
+            self._rec_start.append(len(self._rec_state))
+            self._rec_count.append(len(state.recipients))
+            self._append_recipients(state.recipients)
+            self._counts[code] += 1
+            self._slots.append(0)
+            self._enqueue(len(self._states) - 1, code, now)
+            return
+
+        old = self._states[i]
+        if old != code:
+            self._counts[old] -= 1
+            self._counts[code] += 1
+            self._states[i] = code
+            self._since[i] = now
+            self._enqueue(i, code, now)
+            if len(self._index[old]) > max(_MIN_GARBAGE, 2 * self._counts[old]):
+                self._reindex(old, list(self._live(old)))
+        self._flags[i] = flags
+
+        if self._rec_count[i] == len(state.recipients):
+            start = self._rec_start[i]
+            for j, recipient in enumerate(state.recipients, start):
+                self._rec_phone[j] = self._phones.add(recipient.phone_number)
+                self._rec_state[j] = _CODES[recipient.state]
+                self._rec_error[j] = self._add_error(recipient.error)
+        else:
+            # old rows are left unused until the next `compact`
+            self._dead_rows += self._rec_count[i]
+            self._rec_start[i] = len(self._rec_state)
+            self._rec_count[i] = len(state.recipients)
+            self._append_recipients(state.recipients)
+            live = len(self._rec_state) - self._dead_rows
+            if self._dead_rows > max(_MIN_GARBAGE, live):
+                self.compact()
+
+    def state(self, _id: str) -> ProcessState:
+        """Returns the current state without building `MessageState`."""
+        return _STATES[self._states[self._ids.index[_id]]]
+
+    def counts(self) -> t.Dict[ProcessState, int]:
+        return {state: self._counts[code] for code, state in enumerate(_STATES)}
+
+    def ids(self, state: ProcessState) -> t.List[str]:
+        return [self._ids.values[i] for i in self._find(state)]
+
+    def older_than(
+        self,
+        state: ProcessState,
+        seconds: float,
+        *,
+        now: t.Optional[float] = None,
+    ) -> t.List[str]:
+        """Returns IDs of messages that have been in `state` for over `seconds`."""
+        if now is None:
+            now = time.time()
+
+        code = _CODES[state]
+        if not self._sorted[code]:
+            # `now` went backwards, e.g. the clock was adjusted
+            self._reindex(code, list(self._live(code)))
+
+        deadline = now - seconds
+        since = self._since
+        ids = self._ids.values
+
+        result = []
+        for i in self._live(code):
+            if since[i] >= deadline:
+                break
+            result.append(ids[i])
+
+        return result
+
+    def compact(self) -> None:
+        """Drops recipient rows left unused by updates that changed their count."""
+        if not self._dead_rows:
+            return
+
+        rec_start = array.array("I")
+        rec_phone = array.array("I")
+        rec_state = bytearray()
+        rec_error = array.array("i")
+        for start, count in zip(self._rec_start, self._rec_count):
+            rec_start.append(len(rec_state))
+            rec_phone.extend(self._rec_phone[start : start + count])
+            rec_state.extend(self._rec_state[start : start + count])
+            rec_error.extend(self._rec_error[start : start + count])
+
+        self._rec_start = rec_start
+        self._rec_phone = rec_phone
+        self._rec_state = rec_state
+        self._rec_error = rec_error
+        self._dead_rows = 0
+
+    def save(self, path: str) -> None:
+        """Atomically writes a snapshot of the tracker to `path`, see `load`."""
+        self.compact()
+        header = {
+            "byteorder": sys.byteorder,
+            "ids": self._ids.values,
+            "phones": self._phones.values,
+            "errors": self._errors.values,
+            "columns": [
+                {
+                    "typecode": _typecode(column),
+                    "itemsize": _itemsize(column),
+                    "length": len(column),
+                }
+                for column in (getattr(self, name) for name in _COLUMNS)
+            ],
+        }
+
+        fd, tmp = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp"
+        )
+        try:
+            # mkstemp creates the file with 0600, use the usual mode instead
+            os.chmod(tmp, 0o666 & ~_umask())
+            with os.fdopen(fd, "wb") as f:
+                f.write(json.dumps(header, separators=(",", ":")).encode("utf-8"))
+                f.write(b"\n")
+                for name in _COLUMNS:
+                    f.write(bytes(getattr(self, name)))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "MessageTracker":
+        tracker = cls()
+
+        with open(path, "rb") as f:
+            header = json.loads(f.readline())
+            if len(header["columns"]) != len(_COLUMNS):
+                raise ValueError("Unsupported snapshot format")
+
+            swap = header["byteorder"] != sys.byteorder
+            for name, spec in zip(_COLUMNS, header["columns"]):
+                column = getattr(tracker, name)
+                if (spec["typecode"], spec["itemsize"]) != (
+                    _typecode(column),
+                    _itemsize(column),
+                ):
+                    raise ValueError(f"Incompatible snapshot column {name}")
+
+                size = spec["length"] * spec["itemsize"]
+                data = f.read(size)
+                if len(data) != size:
+                    raise ValueError("Snapshot is truncated")
+
+                if isinstance(column, bytearray):
+                    column.extend(data)
+                    continue
+
+                column.frombytes(data)
+                if swap:
+                    column.byteswap()
+
+        tracker._ids = _Interner(header["ids"])
+        tracker._phones = _Interner(header["phones"])
+        tracker._errors = _Interner(header["errors"])
+        if not tracker._is_consistent():
+            raise ValueError("Snapshot is inconsistent")
+
+        tracker._slots = array.array("I", [0]) * len(tracker._states)
+        rows: t.List[t.List[int]] = [[] for _ in _STATES]
+        for i, code in enumerate(tracker._states):
+            rows[code].append(i)
+        for code, state_rows in enumerate(rows):
+            tracker._counts[code] = len(state_rows)
+            tracker._reindex(code, state_rows)
+
+        return tracker
+
+    def _is_consistent(self) -> bool:
+        rows = len(self._ids)
+        if len(self._ids.index) != rows or any(
+            len(column) != rows
+            for column in (
+                self._states,
+                self._since,
+                self._flags,
+                self._rec_start,
+                self._rec_count,
+            )
+        ):
+            return False
+
+        rec_rows = len(self._rec_state)
+        if len(self._rec_phone) != rec_rows or len(self._rec_error) != rec_rows:
+            return False
+
+        return (
+            max(self._states, default=0) < len(_STATES)
+            and max(self._rec_state, default=0) < len(_STATES)
+            and all(
+                start + count <= rec_rows
+                for start, count in zip(self._rec_start, self._rec_count)
+            )
+            and max(self._rec_phone, default=-1) < len(self._phones)
+            and min(self._rec_error, default=_NO_ERROR) >= _NO_ERROR
+            and max(self._rec_error, default=_NO_ERROR) < len(self._errors)
+        )
+
+    def _find(self, state: ProcessState) -> t.Iterator[int]:
+        code = _CODES[state]
+        states = self._states
+        i = states.find(code)
+        while i != -1:
+            yield i
+            i = states.find(code, i + 1)
+
+    def _build(self, i: int) -> MessageState:
+        flags = self._flags[i]
+        start = self._rec_start[i]
+        phones = self._phones.values
+        errors = self._errors.values
+
+        return MessageState(
+            id=self._ids.values[i],
+            state=_STATES[self._states[i]],
+            recipients=[
+                RecipientState(
+                    phone_number=phones[self._rec_phone[j]],
+                    state=_STATES[self._rec_state[j]],
+                    error=(
+                        errors[self._rec_error[j]]
+                        if self._rec_error[j] != _NO_ERROR
+                        else None
+                    ),
+                )
+                for j in range(start, start + self._rec_count[i])
+            ],
+            is_hashed=bool(flags & _HASHED),
+            is_encrypted=bool(flags & _ENCRYPTED),
+        )
+
+    def _add_error(self, error: t.Optional[str]) -> int:
+        return _NO_ERROR if error is None else self._errors.add(error)
+
+    def _append_recipients(self, recipients: t.List[RecipientState]) -> None:
+        for recipient in recipients:
+            self._rec_phone.append(self._phones.add(recipient.phone_number))
+            self._rec_state.append(_CODES[recipient.state])
+            self._rec_error.append(self._add_error(recipient.error))
+
+    def _enqueue(self, i: int, code: int, now: float) -> None:
+        index = self._index[code]
+        if now < self._last[code]:
+            self._sorted[code] = False
+        self._last[code] = now
+        self._slots[i] = len(index)
+        index.append(i)
+
+    def _live(self, code: int) -> t.Iterator[int]:
+        states = self._states
+        slots = self._slots
+        for pos, i in enumerate(self._index[code]):
+            if states[i] == code and slots[i] == pos:
+                yield i
+
+    def _reindex(self, code: int, rows: t.Iterable[int]) -> None:
+        """Rebuilds the index of a state from its rows, sorted by `since`."""
+        slots = self._slots
+        index = array.array("I", sorted(rows, key=self._since.__getitem__))
+        for pos, i in enumerate(index):
+            slots[i] = pos
+        self._index[code] = index
+        self._sorted[code] = True
+        self._last[code] = self._since[index[-1]] if index else float("-inf")
+
+
+def _typecode(column: t.Union[array.array, bytearray]) -> str:
+    return column.typecode if isinstance(column, array.array) else "B"
+
+
+def _itemsize(column: t.Union[array.array, bytearray]) -> int:
+    return column.itemsize if isinstance(column, array.array) else 1
+
+
+def _umask() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+
+    return umask
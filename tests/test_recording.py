@@ -0,0 +1,218 @@
+import asyncio
+import json
+
+import pytest
+
+from android_sms_gateway import recording
+from android_sms_gateway.client import APIClient
+from android_sms_gateway.domain import Message
+from android_sms_gateway.recording import (
+    AsyncRecordingHttpClient,
+    AsyncReplayHttpClient,
+    RecordedError,
+    RecordingHttpClient,
+    ReplayHttpClient,
+)
+
+STATE = {
+    "id": "123",
+    "state": "Pending",
+    "recipients": [{"phoneNumber": "+1234567890", "state": "Pending"}],
+}
+
+
+class FakeHttpClient:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def get(self, url, *, headers=None):
+        return {**STATE, "state": "Sent"}
+
+    def post(self, url, payload, *, headers=None):
+        return STATE
+
+
+class FakeResponse:
+    status_code = 503
+
+
+class FakeHTTPError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+        self.response = FakeResponse()
+
+
+class FailingHttpClient(FakeHttpClient):
+    def get(self, url, *, headers=None):
+        raise FakeHTTPError("Service Unavailable")
+
+
+class FakeAsyncHttpClient:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    async def get(self, url, *, headers=None):
+        return {**STATE, "state": "Sent"}
+
+    async def post(self, url, payload, *, headers=None):
+        return STATE
+
+
+def test_record_and_replay(tmp_path):
+    path = str(tmp_path / "traffic.ndjson")
+    message = Message("Hello", ["+1234567890"])
+
+    with RecordingHttpClient(FakeHttpClient(), path) as http:
+        client = APIClient("login", "password", http=http)
+        client.send(message)
+        client.get_state("123")
+
+    with open(path) as f:
+        entries = [json.loads(line) for line in f]
+    assert [e["method"] for e in entries] == ["POST", "GET"]
+    assert entries[0]["payload"] == message.asdict()
+    assert all("headers" not in e for e in entries)
+
+    with ReplayHttpClient(path, latency=0) as http:
+        client = APIClient("login", "password", http=http)
+        assert client.send(message).state.name == "Pending"
+        assert client.get_state("123").state.name == "Sent"
+
+        with pytest.raises(LookupError):
+            client.get_state("123")
+
+
+def test_async_record_and_replay(tmp_path):
+    path = str(tmp_path / "traffic.ndjson")
+
+    async def run():
+        async with AsyncRecordingHttpClient(FakeAsyncHttpClient(), path) as http:
+            await http.post("https://example.com/message", {"message": "Hello"})
+            await http.get("https://example.com/message/123")
+
+        async with AsyncReplayHttpClient(path, latency=0) as http:
+            assert await http.get("https://example.com/message/123") == {
+                **STATE,
+                "state": "Sent",
+            }
+            assert await http.post("https://example.com/message", {}) == STATE
+
+    asyncio.run(run())
+
+
+def test_replay_negative_latency(tmp_path):
+    path = tmp_path / "traffic.ndjson"
+    path.write_text("")
+
+    with pytest.raises(ValueError):
+        ReplayHttpClient(str(path), latency=-1)
+
+
+def test_record_and_replay_error(tmp_path):
+    path = str(tmp_path / "traffic.ndjson")
+
+    with RecordingHttpClient(FailingHttpClient(), path) as http:
+        with pytest.raises(FakeHTTPError):
+            http.get("https://example.com/message/123")
+        http.post("https://example.com/message", {})
+
+    with open(path) as f:
+        entry = json.loads(f.readline())
+    assert entry["error"] == {
+        "type": "FakeHTTPError",
+        "message": "Service Unavailable",
+        "status": 503,
+    }
+    assert "response" not in entry
+    assert "elapsed" in entry
+
+    with ReplayHttpClient(path, latency=0) as http:
+        with pytest.raises(RecordedError) as exc_info:
+            http.get("https://example.com/message/123")
+        assert exc_info.value.type == "FakeHTTPError"
+        assert exc_info.value.status == 503
+
+        assert http.post("https://example.com/message", {}) == STATE
+
+
+def write_entry(path, elapsed):
+    path.write_text(
+        json.dumps(
+            {
+                "method": "GET",
+                "url": "https://example.com/message/123",
+                "response": STATE,
+                "elapsed": elapsed,
+            }
+        )
+        + "\n"
+    )
+
+
+def test_replay_scaled_latency(tmp_path, monkeypatch):
+    path = tmp_path / "traffic.ndjson"
+    write_entry(path, 0.4)
+    delays = []
+    monkeypatch.setattr(recording.time, "sleep", delays.append)
+
+    with ReplayHttpClient(str(path), latency=0.5) as http:
+        assert http.get("https://example.com/message/123") == STATE
+
+    assert delays == [pytest.approx(0.2)]
+
+
+def test_async_replay_scaled_latency(tmp_path, monkeypatch):
+    path = tmp_path / "traffic.ndjson"
+    write_entry(path, 0.4)
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(recording.asyncio, "sleep", sleep)
+
+    async def run():
+        async with AsyncReplayHttpClient(str(path), latency=0.5) as http:
+            assert await http.get("https://example.com/message/123") == STATE
+
+    asyncio.run(run())
+
+    assert delays == [pytest.approx(0.2)]
+
+
+class EchoHttpClient(FakeHttpClient):
+    def post(self, url, payload, *, headers=None):
+        return {**STATE, "id": payload["id"]}
+
+
+def test_entries_are_flushed(tmp_path):
+    path = tmp_path / "traffic.ndjson"
+
+    with RecordingHttpClient(FakeHttpClient(), str(path)) as http:
+        http.get("https://example.com/message/123")
+
+        assert json.loads(path.read_text())["method"] == "GET"
+
+
+def test_replay_matches_payload(tmp_path):
+    path = str(tmp_path / "traffic.ndjson")
+    url = "https://example.com/message"
+
+    with RecordingHttpClient(EchoHttpClient(), path) as http:
+        for _id in ("1", "2", "3"):
+            http.post(url, {"id": _id, "message": "Hello"})
+
+    with ReplayHttpClient(path, latency=0) as http:
+        assert http.post(url, {"message": "Hello", "id": "3"})["id"] == "3"
+        assert http.post(url, {"id": "1", "message": "Hello"})["id"] == "1"
+        # unknown payload gets the next unused response
+        assert http.post(url, {"id": "4", "message": "Hello"})["id"] == "2"
+
+        with pytest.raises(LookupError):
+            http.post(url, {"id": "2", "message": "Hello"})
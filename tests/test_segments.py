@@ -0,0 +1,83 @@
+import datetime
+
+import pytest
+
+from android_sms_gateway.domain import Message
+from android_sms_gateway.enums import MessageEncoding
+from android_sms_gateway.segments import (
+    count_segments,
+    count_segments_batch,
+    plan_campaign,
+)
+
+
+@pytest.mark.parametrize(
+    "text,encoding,units,parts",
+    [
+        ("", MessageEncoding.GSM7, 0, 1),
+        ("a" * 160, MessageEncoding.GSM7, 160, 1),
+        ("a" * 161, MessageEncoding.GSM7, 161, 2),
+        ("a" * 306, MessageEncoding.GSM7, 306, 2),
+        ("a" * 307, MessageEncoding.GSM7, 307, 3),
+        ("€" * 80, MessageEncoding.GSM7, 160, 1),
+        # escape sequence is moved to the next part
+        ("a" * 152 + "€" + "a" * 7, MessageEncoding.GSM7, 161, 2),
+        ("a" * 152 + "€" + "a" * 152, MessageEncoding.GSM7, 306, 3),
+        ("a" * 159 + "😀", MessageEncoding.UCS2, 161, 3),
+        ("ж" * 70, MessageEncoding.UCS2, 70, 1),
+        ("ж" * 71, MessageEncoding.UCS2, 71, 2),
+        ("ж" * 134, MessageEncoding.UCS2, 134, 2),
+        # surrogate pair is moved to the next part
+        ("ж" * 66 + "😀" + "ж" * 66, MessageEncoding.UCS2, 134, 3),
+    ],
+)
+def test_count_segments(text, encoding, units, parts):
+    segments = count_segments(text)
+
+    assert segments.encoding == encoding
+    assert segments.units == units
+    assert segments.parts == parts
+
+
+def test_count_segments_batch():
+    texts = ["Hello", "Привет", "Hello"]
+
+    assert count_segments_batch(texts) == [count_segments(text) for text in texts]
+
+
+def test_plan_campaign():
+    messages = [
+        Message("a" * 200, ["+1", "+2"]),
+        Message("Hello 😀", ["+3"]),
+    ]
+
+    plan = plan_campaign(messages, parts_per_minute=5, devices=2)
+
+    assert plan.messages == 2
+    assert plan.recipients == 3
+    assert plan.parts == 5
+    # the first message takes 4 parts on one device
+    assert plan.duration == datetime.timedelta(seconds=48)
+
+
+def test_plan_campaign_message_is_not_split_between_devices():
+    messages = [Message("Hello", [f"+{i}" for i in range(100)])]
+
+    plan = plan_campaign(messages, parts_per_minute=10, devices=10)
+
+    assert plan.parts == 100
+    assert plan.duration == datetime.timedelta(minutes=10)
+
+
+def test_plan_campaign_balances_devices():
+    messages = [Message("Hello", ["+1"] * n) for n in (7, 5, 4, 3, 1)]
+
+    plan = plan_campaign(messages, parts_per_minute=1, devices=2)
+
+    assert plan.parts == 20
+    assert plan.duration == datetime.timedelta(minutes=10)
+
+
+def test_plan_campaign_encrypted():
+    with pytest.raises(ValueError):
+        plan_campaign([Message("...", ["..."], is_encrypted=True)], parts_per_minute=1)
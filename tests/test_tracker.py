@@ -0,0 +1,207 @@
+import array
+import json
+import os
+
+import pytest
+
+from android_sms_gateway.domain import MessageState, RecipientState
+from android_sms_gateway.enums import ProcessState
+from android_sms_gateway.tracker import MessageTracker
+
+
+def make_state(_id, state, recipients=1, error=None):
+    return MessageState(
+        id=_id,
+        state=state,
+        recipients=[
+            RecipientState(phone_number=f"+{i}", state=state, error=error)
+            for i in range(recipients)
+        ],
+        is_hashed=False,
+        is_encrypted=True,
+    )
+
+
+def test_update_and_get():
+    tracker = MessageTracker()
+    state = make_state("1", ProcessState.Pending, recipients=2)
+
+    tracker.update(state)
+
+    assert len(tracker) == 1
+    assert "1" in tracker
+    assert tracker["1"] == state
+    assert tracker.get("2") is None
+    with pytest.raises(KeyError):
+        tracker["2"]
+
+
+def test_update_existing():
+    tracker = MessageTracker()
+    tracker.update(make_state("1", ProcessState.Pending), now=0)
+    tracker.update(make_state("2", ProcessState.Pending), now=0)
+
+    failed = make_state("1", ProcessState.Failed, error="Timeout")
+    tracker.update(failed, now=10)
+    assert tracker["1"] == failed
+    assert tracker.state("1") == ProcessState.Failed
+
+    sent = make_state("1", ProcessState.Sent, recipients=3)
+    tracker.update(sent, now=20)
+    assert tracker["1"] == sent
+
+    assert len(tracker) == 2
+    assert tracker.counts()[ProcessState.Pending] == 1
+    assert tracker.counts()[ProcessState.Sent] == 1
+    assert tracker.counts()[ProcessState.Failed] == 0
+
+
+def test_queries():
+    tracker = MessageTracker()
+    tracker.update(make_state("1", ProcessState.Pending), now=0)
+    tracker.update(make_state("2", ProcessState.Sent), now=0)
+    tracker.update(make_state("3", ProcessState.Pending), now=50)
+    # same state doesn't reset the time
+    tracker.update(make_state("1", ProcessState.Pending), now=80)
+
+    assert tracker.ids(ProcessState.Pending) == ["1", "3"]
+    assert tracker.older_than(ProcessState.Pending, 60, now=100) == ["1"]
+    assert tracker.older_than(ProcessState.Pending, 10, now=100) == ["1", "3"]
+    assert tracker.older_than(ProcessState.Delivered, 0, now=100) == []
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "tracker.bin")
+    tracker = MessageTracker()
+    tracker.update(make_state("1", ProcessState.Pending, recipients=2), now=0)
+    tracker.update(make_state("2", ProcessState.Failed, error="Timeout"), now=5)
+    tracker.update(make_state("1", ProcessState.Sent, recipients=1), now=10)
+
+    tracker.save(path)
+    loaded = MessageTracker.load(path)
+
+    assert list(loaded) == list(tracker)
+    assert all(loaded[_id] == tracker[_id] for _id in tracker)
+    assert loaded.counts() == tracker.counts()
+    assert loaded.older_than(ProcessState.Failed, 1, now=10) == ["2"]
+
+
+def test_older_than_many_rows():
+    tracker = MessageTracker()
+    expected = {}
+    states = list(ProcessState)
+    # enough state changes to rebuild the indexes several times
+    for now in range(20000):
+        _id = str(now % 3000)
+        state = states[(now * 7) % len(states)]
+        tracker.update(make_state(_id, state), now=now)
+        if expected.get(_id, (None,))[0] != state:
+            expected[_id] = (state, now)
+
+    for state in states:
+        for seconds in (0, 100, 1000, 5000):
+            assert sorted(tracker.older_than(state, seconds, now=20000)) == sorted(
+                _id
+                for _id, (s, since) in expected.items()
+                if s == state and since < 20000 - seconds
+            )
+        assert tracker.counts()[state] == sum(
+            1 for s, _ in expected.values() if s == state
+        )
+
+
+def test_older_than_out_of_order():
+    tracker = MessageTracker()
+    tracker.update(make_state("1", ProcessState.Pending), now=100)
+    tracker.update(make_state("2", ProcessState.Pending), now=10)
+
+    assert tracker.older_than(ProcessState.Pending, 50, now=100) == ["2"]
+
+
+def test_recipient_rows_stay_bounded():
+    tracker = MessageTracker()
+    tracker.update(make_state("0", ProcessState.Pending), now=0)
+    for i in range(5000):
+        tracker.update(make_state("1", ProcessState.Pending, recipients=1 + i % 2))
+
+    assert len(tracker._rec_state) <= 1024 + 3 + 2
+    expected = make_state("1", ProcessState.Pending, recipients=2)
+    assert tracker["1"].recipients == expected.recipients
+
+    tracker.compact()
+    assert len(tracker._rec_state) == 3
+    assert tracker["0"] == make_state("0", ProcessState.Pending)
+
+
+def test_save_is_atomic(tmp_path, monkeypatch):
+    path = tmp_path / "tracker.bin"
+    path.write_bytes(b"previous")
+    tracker = MessageTracker()
+    tracker.update(make_state("1", ProcessState.Pending))
+
+    def fail(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        tracker.save(str(path))
+
+    assert path.read_bytes() == b"previous"
+    assert [p.name for p in tmp_path.iterdir()] == ["tracker.bin"]
+
+
+def test_load_incompatible_itemsize(tmp_path):
+    path = tmp_path / "tracker.bin"
+    tracker = MessageTracker()
+    tracker.update(make_state("1", ProcessState.Pending))
+    tracker.save(str(path))
+
+    header, data = path.read_bytes().split(b"\n", 1)
+    header = json.loads(header)
+    header["columns"][3]["itemsize"] = 8
+    path.write_bytes(json.dumps(header).encode() + b"\n" + data)
+
+    with pytest.raises(ValueError, match="_rec_start"):
+        MessageTracker.load(str(path))
+
+
+def test_older_than_sorts_index_again():
+    tracker = MessageTracker()
+    for now in (100, 10, 200, 50):
+        tracker.update(make_state(str(now), ProcessState.Pending), now=now)
+    code = list(ProcessState).index(ProcessState.Pending)
+    assert not tracker._sorted[code]
+
+    assert tracker.older_than(ProcessState.Pending, 0, now=150) == ["10", "50", "100"]
+    assert tracker._sorted[code]
+
+
+@pytest.mark.parametrize(
+    "column,value",
+    [
+        ("_states", bytearray([0, 0])),
+        ("_since", array.array("d")),
+        ("_rec_count", array.array("I", [3])),
+        ("_rec_state", bytearray([0])),
+        ("_rec_phone", array.array("I", [0, 5])),
+    ],
+)
+def test_load_inconsistent(tmp_path, column, value):
+    path = str(tmp_path / "tracker.bin")
+    tracker = MessageTracker()
+    tracker.update(make_state("1", ProcessState.Pending, recipients=2))
+    setattr(tracker, column, value)
+    tracker.save(path)
+
+    with pytest.raises(ValueError, match="inconsistent"):
+        MessageTracker.load(path)
+
+
+def test_save_file_mode(tmp_path):
+    path = tmp_path / "tracker.bin"
+    reference = tmp_path / "reference"
+    reference.write_bytes(b"")
+
+    MessageTracker().save(str(path))
+
+    assert path.stat().st_mode == reference.stat().st_mode